@@ -9,124 +9,507 @@ check_archives.py
     - otherwise query Wayback CDX for snapshots of the original URL using several patterns
     - for each snapshot, fetch HTML and search for mailto:<email>
     - if found, record snapshot URL and an excerpt (surrounding text)
-  - Writes found_archives.txt and found_excerpts.txt
+  - Appends to found_archives.txt and found_excerpts.txt as hits are found
 """
 
 import argparse
+import codecs
+import functools
+import json
+import logging
+import logging.handlers
+import queue
 import re
-import sys
+import string
+import threading
 import time
-from urllib.parse import quote
-import requests
-from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote, urlsplit, urlunsplit
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from urllib3.util.retry import Retry
 
 USER_AGENT = "Mozilla/5.0 (compatible; MailtoFinder/1.0; +https://example.com)"
-CDX_API_TEMPLATE = "https://web.archive.org/cdx/search/cdx?url={orig}&output=json&fl=timestamp,original&filter=statuscode:200&collapse=digest"
+# one snapshot per original URL per year is enough to cover distinct page content
+CDX_API_TEMPLATE = "https://web.archive.org/cdx/search/cdx?url={orig}&output=json&fl=timestamp,original,digest&filter=statuscode:200&collapse=timestamp:4&limit={limit}"
+CDX_LIMIT = 500
 
-# gentle delay between snapshot fetches (seconds)
-SLEEP_BETWEEN = 0.5
+logger = logging.getLogger("archscan")
+LOG_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+# log records are buffered and written in batches of this size (warnings flush at once)
+LOG_BUFFER = 1000
 
-def fetch_text(url, timeout=30):
-    headers = {"User-Agent": USER_AGENT}
-    r = requests.get(url, headers=headers, timeout=timeout)
-    r.raise_for_status()
-    return r.text
+# direct snapshot URLs, and Wayback "search" URLs like web/*/<pattern>
+SNAP_RE = re.compile(r"web\.archive\.org/web/(\d{8,14})(?:id_)?/(.+)$")
+WILDCARD_RE = re.compile(r"web\.archive\.org/web/\*/(.+)$")
+# last host-looking token in a glob pattern, e.g. "nifty.com" in "*cye04720*nifty.com*"
+HOST_RE = re.compile(r"[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}", re.IGNORECASE)
+
+# Wayback tolerates roughly 15 requests/minute before it starts answering 429
+RATE_PER_SEC = 0.25
+RATE_BURST = 15
+# retries (and initial backoff in seconds) once we do get 429/503
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_BACKOFF = 300
+# pipeline workers: candidates expanded via CDX concurrently, snapshots fetched concurrently
+CDX_WORKERS = 8
+SNAPSHOT_WORKERS = 5
+# CDX pages fetched per query at most (each page is a rate-limited request of up to 500 rows)
+MAX_CDX_PAGES = 5
+# rows taken from a domain/host-wide query that has no narrowing `original` filter
+WIDE_QUERY_ROWS = 50
+# streamed snapshot reads: chunk size, and give up on pages larger than this (chars)
+CHUNK_SIZE = 65536
+MAX_HTML_CHARS = 2 * 1024 * 1024
+# context kept around a match, see find_mailto_occurrences
+SNIPPET_CONTEXT = 120
+
+# on-disk cache: snapshots (id_ URLs) never change, CDX gets new rows over time
+CACHE_NAME = "wayback_cache"
+CACHE_EXPIRE = 7 * 24 * 3600
+CDX_CACHE_EXPIRE = 24 * 3600
+
+# one keep-alive, cached session for every Wayback request (CDX + snapshots)
+SESSION = CachedSession(
+    CACHE_NAME,
+    backend="sqlite",
+    allowable_methods=("GET",),
+    allowable_codes=(200,),
+    expire_after=CACHE_EXPIRE,
+    urls_expire_after={"web.archive.org/cdx/*": CDX_CACHE_EXPIRE},
+)
+SESSION.headers["User-Agent"] = USER_AGENT
+SESSION.headers["Accept-Encoding"] = "gzip"
+# every request goes to web.archive.org: one host pool with a warm keep-alive
+# connection per worker thread; pool_block makes a thread wait for a free
+# connection instead of opening a throwaway one (new TCP+TLS handshake)
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=CDX_WORKERS + SNAPSHOT_WORKERS,
+    pool_block=True,
+    # 429/503 are rate limiting; _get() handles those with a much longer backoff
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 504]),
+))
+
+class RateLimiter:
+    """Thread-safe token bucket: refills `rate` tokens/sec up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+RATE = RateLimiter(RATE_PER_SEC, RATE_BURST)
+
+def _retry_after(r, default):
+    try:
+        return int(r.headers.get("Retry-After", default))
+    except ValueError:
+        return default
+
+def _get(url, **kwargs):
+    """Rate-limited SESSION.get that waits out 429/503 responses with doubling backoff."""
+    # fresh cache hits never reach Wayback, so they don't spend a token; a miss or
+    # an expired entry comes back as a synthetic 504 (real 504s are never cached)
+    r = SESSION.get(url, only_if_cached=True, **kwargs)
+    if r.status_code != 504:
+        return r
+    r.close()
+    backoff = RATE_LIMIT_BACKOFF
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        RATE.acquire()
+        r = SESSION.get(url, **kwargs)
+        if r.status_code not in (429, 503) or attempt == RATE_LIMIT_RETRIES:
+            return r
+        delay = _retry_after(r, backoff)
+        r.close()
+        logger.warning("%s from Wayback; sleeping %ss before retrying %s", r.status_code, delay, url)
+        time.sleep(delay)
+        backoff *= 2
+
+# ASCII-only lowercasing keeps string length (str.lower() turns "İ" into 2 code points),
+# so offsets found in the lowered copy stay valid in the original text
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def _snippet(html_text, start, end):
+    start = max(0, start - SNIPPET_CONTEXT)
+    end = min(len(html_text), end + SNIPPET_CONTEXT)
+    return html_text[start:end].replace("\r", " ").replace("\n", " ")
 
 def find_mailto_occurrences(html_text, email):
     """
-    Return list of (snippet, full_match) for occurrences of mailto link or mailto in text.
+    Yield (snippet, full_match) for each mailto:<email> in the page, whether in
+    an href or plain text, using one (ASCII) case-insensitive str.find pass.
     snippet is a small context around the match (approx 120 chars).
     """
-    results = []
-    # look for href="mailto:...email..."
-    href_pattern = re.compile(r'href\s*=\s*["\']\s*mailto\s*:\s*' + re.escape(email) + r'\s*["\']', re.IGNORECASE)
-    for m in href_pattern.finditer(html_text):
-        start = max(0, m.start() - 120)
-        end = min(len(html_text), m.end() + 120)
-        snippet = html_text[start:end].replace("\r", " ").replace("\n", " ")
-        results.append((snippet, m.group(0)))
-    # fallback: plain mailto:... anywhere
-    plain_pattern = re.compile(r'mailto\s*:\s*' + re.escape(email), re.IGNORECASE)
-    for m in plain_pattern.finditer(html_text):
-        # avoid duplicates if already captured
-        if href_pattern.search(html_text, max(0, m.start()-50), min(len(html_text), m.end()+50)):
-            continue
-        start = max(0, m.start() - 120)
-        end = min(len(html_text), m.end() + 120)
-        snippet = html_text[start:end].replace("\r", " ").replace("\n", " ")
-        results.append((snippet, m.group(0)))
-    return results
-
-def query_cdx(orig_url):
-    """Return list of (timestamp, original) from CDX or empty list on failure"""
+    hay = html_text.translate(ASCII_LOWER)
+    needle = f"mailto:{email.translate(ASCII_LOWER)}"
+    i = 0
+    while (j := hay.find(needle, i)) != -1:
+        end = j + len(needle)
+        yield _snippet(html_text, j, end), html_text[j:end]
+        i = end
+
+# charset labels old Japanese pages declare that Python's codec registry doesn't know
+CHARSET_ALIASES = {"x-sjis": "shift_jis", "windows-31j": "cp932", "x-euc-jp": "euc_jp"}
+
+def _decodable_encoding(encoding):
+    """Map a declared charset to a codec Python has, falling back to latin-1 (the needle is ASCII)."""
+    if encoding is None:
+        return "utf-8"
+    encoding = CHARSET_ALIASES.get(encoding.lower(), encoding)
     try:
-        api = CDX_API_TEMPLATE.format(orig=quote(orig_url, safe=""))
-        r = requests.get(api, headers={"User-Agent": USER_AGENT}, timeout=30)
+        codecs.lookup(encoding)
+    except LookupError:
+        return "latin-1"
+    return encoding
+
+@functools.lru_cache(maxsize=2048)
+def fetch_and_scan(url, email, timeout=30):
+    """
+    Stream a snapshot and return find_mailto_occurrences() hits, reading only
+    until mailto:<email> (plus trailing snippet context) has arrived.
+    Memoised so a URL listed both directly and via CDX is only scanned once.
+    """
+    needle = f"mailto:{email.translate(ASCII_LOWER)}"
+    buf = ""
+    found_at = -1
+    with _get(url, stream=True, timeout=timeout) as r:
         r.raise_for_status()
-        data = r.json()
-    except Exception as e:
-        print(f"[!] CDX API error for {orig_url}: {e}", file=sys.stderr)
-        return []
-    if not isinstance(data, list) or len(data) < 2:
-        return []
-    rows = []
-    for row in data[1:]:
-        if isinstance(row, list) and len(row) >= 2:
-            rows.append((row[0], row[1]))
-    return rows
+        r.encoding = _decodable_encoding(r.encoding)
+        for chunk in r.iter_content(CHUNK_SIZE, decode_unicode=True):
+            # only rescan the new tail (plus overlap for a needle split across chunks)
+            start = max(0, len(buf) - len(needle) + 1)
+            buf += chunk
+            if found_at == -1:
+                pos = buf[start:].translate(ASCII_LOWER).find(needle)
+                if pos != -1:
+                    found_at = start + pos
+            if found_at != -1 and len(buf) >= found_at + len(needle) + SNIPPET_CONTEXT:
+                break
+            if len(buf) > MAX_HTML_CHARS:
+                break
+    if found_at == -1:
+        return ()
+    return tuple(find_mailto_occurrences(buf, email))
+
+def _cdx_num_pages(api):
+    """Ask CDX how many result pages `api` spans (1 if the server won't say)."""
+    try:
+        r = _get(api + "&showNumPages=true", timeout=30)
+        r.raise_for_status()
+        return max(1, int(json.loads(r.text)))
+    except Exception:
+        return 1
+
+def _parse_cdx_line(line):
+    """Parse one row of Wayback's line-per-row JSON output, or None for brackets/header."""
+    line = line.strip().rstrip(b",")
+    if line.startswith(b"[["):
+        line = line[1:]
+    if line.endswith(b"]]"):
+        line = line[:-1]
+    if not line.startswith(b"[") or line == b"[]":
+        return None
+    row = json.loads(line)
+    if not isinstance(row, list) or len(row) < 3 or row[0] == "timestamp":
+        return None
+    return row[0], row[1], row[2]
+
+def cdx_rows(api):
+    """Yield (timestamp, original, digest) rows as the CDX response streams in."""
+    with _get(api, stream=True, timeout=30) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            row = _parse_cdx_line(line)
+            if row is not None:
+                yield row
+
+def _glob_regex(pattern):
+    """Case-insensitive regex (CDX filter syntax) matching the whole glob pattern."""
+    return "(?i)" + ".*".join(re.escape(part) for part in pattern.split("*"))
+
+def classify_pattern(p):
+    """
+    Map a glob-like candidate onto a native CDX query (url, matchType, original filter):
+      *.host/...    -> (host, "domain"), filtered on the pattern if the path part is narrower than *
+      host/path/*   -> ("host/path/", "prefix")
+      *foo*host*    -> (host, "domain"), filtered on the pattern
+    Patterns without * are plain URLs: (p, None, None). Infix globs naming no
+    host (*foo*) have no CDX equivalent and return None.
+    """
+    if "*" not in p:
+        return p, None, None
+    if p.startswith("*."):
+        host, _, rest = p[2:].partition("/")
+        return host, "domain", (_glob_regex(p) if rest.strip("*") else None)
+    if p.endswith("*") and "*" not in p[:-1]:
+        return p[:-1], "prefix", None
+    hosts = HOST_RE.findall(p)
+    if not hosts:
+        return None
+    return hosts[-1], "domain", _glob_regex(p)
+
+def _is_host_wide(cdx_url, match_type):
+    """True for queries spanning a whole domain or host (e.g. "8028.teacup.com/" as a prefix)."""
+    if match_type == "domain":
+        return True
+    return match_type == "prefix" and "/" not in cdx_url.split("://")[-1].rstrip("/")
+
+def query_cdx(orig_url, match_type=None, original_filter=None, max_rows=None):
+    """
+    Yield (timestamp, original, digest) from CDX; failed pages are logged and skipped.
+    With max_rows, only a single page of at most that many rows is requested.
+    """
+    api = CDX_API_TEMPLATE.format(orig=quote(orig_url, safe=""), limit=max_rows or CDX_LIMIT)
+    if match_type:
+        api += f"&matchType={match_type}"
+    if original_filter:
+        api += "&filter=" + quote(f"original:{original_filter}", safe="")
+    if max_rows:
+        n_pages = 1
+    else:
+        n_pages = _cdx_num_pages(api)
+        if n_pages > MAX_CDX_PAGES:
+            logger.warning("CDX results for %s truncated: scanning %d of %d pages", orig_url, MAX_CDX_PAGES, n_pages)
+            n_pages = MAX_CDX_PAGES
+    for page in range(n_pages):
+        try:
+            yield from cdx_rows(f"{api}&page={page}")
+        except Exception as e:
+            logger.warning("CDX API error for %s (page %d): %s", orig_url, page, e)
 
 def scan_snapshot(snapshot_url, email):
-    """Fetch snapshot and return list of snippets if mailto found"""
+    """Fetch snapshot and return list of snippets if mailto found, or None if the fetch failed"""
     try:
-        html = fetch_text(snapshot_url)
+        return fetch_and_scan(snapshot_url, email)
     except Exception as e:
-        print(f"[!] fetch failed for {snapshot_url}: {e}", file=sys.stderr)
-        return []
-    hits = find_mailto_occurrences(html, email)
-    return hits
+        logger.debug("fetch failed for %s: %s", snapshot_url, e)
+        return None
+
+def _scan_logged(snapshot_url, email):
+    logger.debug("Checking %s", snapshot_url)
+    return scan_snapshot(snapshot_url, email)
 
-def process_archive_url(url, email, found_set, excerpts):
-    """If URL is a direct archive URL, test it; otherwise query CDX and test snapshots."""
+DEFAULT_PORTS = {"http": ":80", "https": ":443"}
+
+def canon(url):
+    """
+    Canonical form of a candidate URL for de-duplication: lowercase scheme and
+    host, no default port or fragment, "/" for an empty path and sorted query
+    params (CDX canonicalises the same way). Wildcard patterns are left alone.
+    """
+    s = urlsplit(url.strip())
+    if s.scheme.lower() not in DEFAULT_PORTS or "*" in url:
+        return url.strip()
+    scheme = s.scheme.lower()
+    netloc = s.netloc.lower()
+    if netloc.endswith(DEFAULT_PORTS[scheme]):
+        netloc = netloc[:-len(DEFAULT_PORTS[scheme])]
+    query = s.query
+    # a snapshot path embeds the archived URL, whose query must stay as captured
+    if netloc != "web.archive.org":
+        query = "&".join(sorted(q for q in query.split("&") if q))
+    return urlunsplit((scheme, netloc, s.path or "/", query, ""))
+
+def process_archive_url(url, snap_q, stop=None, hit_originals=None):
+    """
+    CDX stage for one candidate: if URL is a direct archive URL queue it as-is,
+    otherwise query CDX and queue every snapshot as (snapshot, original, digest).
+    Stops paging early once the `stop` event is set; originals in hit_originals
+    (early exit) are no longer queued, and a single-URL query stops altogether.
+    """
     if "web.archive.org" in url:
-        # ignore wildcard-like candidate containing * (from patterns)
-        if "*" in url:
+        m = SNAP_RE.search(url)
+        if m:
+            # a concrete snapshot: no CDX round-trip needed, fetch the raw id_ form
+            snap = f"https://web.archive.org/web/{m.group(1)}id_/{m.group(2)}"
+            logger.info("Direct archive URL: %s", snap)
+            snap_q.put((snap, m.group(2), None))
             return
-        print(f"[>] Direct archive URL: {url}")
-        hits = scan_snapshot(url, email)
-        if hits:
-            found_set.add(url)
-            for snip, full in hits:
-                excerpts.append((url, full, snip))
+        m = WILDCARD_RE.search(url)
+        if m:
+            # web/*/<pattern> is a Wayback search page; ask CDX for the pattern instead
+            url = m.group(1)
+            logger.info("Rewriting Wayback search into CDX query: %s", url)
+        elif "*" in url:
+            logger.warning("Skipping unsupported archive pattern: %s", url)
+            return
+        else:
+            logger.info("Direct archive URL: %s", url)
+            snap_q.put((url, url, None))
+            return
+    elif "*" in url:
+        logger.info("Treating as CDX pattern: %s", url)
+    else:
+        # otherwise treat as an original URL and ask CDX for snapshots
+        logger.info("Querying CDX for original URL: %s", url)
+    # glob patterns become one native matchType=prefix/domain query
+    classified = classify_pattern(url)
+    if classified is None:
+        logger.warning("Skipping glob with no host (CDX can't match infix wildcards): %s", url)
         return
+    cdx_url, match_type, original_filter = classified
+    max_rows = None
+    if original_filter is None and _is_host_wide(cdx_url, match_type):
+        # an unfiltered walk of a whole domain would spend the run on unrelated pages
+        max_rows = WIDE_QUERY_ROWS
+        logger.info("Host-wide query without filter, limited to %d rows: %s", max_rows, cdx_url)
+    for ts, orig, digest in query_cdx(cdx_url, match_type, original_filter, max_rows):
+        if stop is not None and stop.is_set():
+            break
+        if hit_originals is not None and orig in hit_originals:
+            if match_type is None:
+                # every row of an exact-URL query is the same page: no more pages needed
+                break
+            continue
+        snap_q.put((f"https://web.archive.org/web/{ts}id_/{orig}", orig, digest))
 
-    # if the URL looks like a domain pattern (contains *) treat as CDX pattern directly
-    if "*" in url:
-        # CDX accepts patterns like *cye04720* (we will pass as-is)
-        print(f"[>] Treating as CDX pattern: {url}")
-        rows = query_cdx(url)
-        for ts, orig in rows:
-            snap = f"https://web.archive.org/web/{ts}id_/{orig}"
-            print(f"    Checking {snap}")
-            hits = scan_snapshot(snap, email)
-            if hits:
-                found_set.add(snap)
-                for snip, full in hits:
-                    excerpts.append((snap, full, snip))
-            time.sleep(SLEEP_BETWEEN)
-        return
+class HitWriter:
+    """
+    Appends each hit to the output files as soon as it is found (thread-safe).
+    `known` are snapshots already in the (append-mode) output file: they are not
+    written twice, but only hits confirmed in this run count towards `confirmed`.
+    """
+
+    def __init__(self, out_f, exc_f, known=()):
+        self.out_f = out_f
+        self.exc_f = exc_f
+        self.found = set(known)
+        self.confirmed = set()
+        # original URLs with at least one confirmed snapshot
+        self.hit_originals = set()
+        self.n_excerpts = 0
+        self.lock = threading.Lock()
 
-    # otherwise treat as an original URL and ask CDX for snapshots
-    print(f"[>] Querying CDX for original URL: {url}")
-    rows = query_cdx(url)
-    for ts, orig in rows:
-        snap = f"https://web.archive.org/web/{ts}id_/{orig}"
-        print(f"    Checking {snap}")
-        hits = scan_snapshot(snap, email)
-        if hits:
-            found_set.add(snap)
+    def record(self, snap, orig, hits):
+        with self.lock:
+            self.hit_originals.add(orig)
+            self.confirmed.add(snap)
+            if snap in self.found:
+                return
+            self.found.add(snap)
+            self.out_f.write(snap + "\n")
+            self.out_f.flush()
             for snip, full in hits:
-                excerpts.append((snap, full, snip))
-        time.sleep(SLEEP_BETWEEN)
+                self.exc_f.write(f"--- {snap} ---\n")
+                self.exc_f.write(f"match: {full}\n")
+                self.exc_f.write(f"{snip}\n\n")
+                self.n_excerpts += 1
+            self.exc_f.flush()
+
+def run_pipeline(candidates, email, writer, seen_digests, early_exit=True):
+    """
+    Two-stage pipeline shared by all candidates: a CDX_WORKERS thread pool turns
+    candidates into snapshot URLs while SNAPSHOT_WORKERS threads scan them.
+    Both stages draw from the same RateLimiter; hits go straight to writer.
+    With early_exit, an original URL's remaining snapshots are skipped once
+    one of them has matched.
+    """
+    snap_q = queue.Queue()
+    lock = threading.Lock()
+    # digests being fetched right now; only successful scans move into seen_digests
+    in_flight = set()
+    # set on Ctrl-C / errors so both stages wind down instead of draining their queues
+    stop = threading.Event()
+
+    def expand(u):
+        if not stop.is_set():
+            process_archive_url(u, snap_q, stop, writer.hit_originals if early_exit else None)
+
+    def snap_worker():
+        while (item := snap_q.get()) is not None and not stop.is_set():
+            snap, orig, digest = item
+            if snap in writer.confirmed:
+                continue
+            if early_exit and orig in writer.hit_originals:
+                continue
+            if digest:
+                # identical content already scanned (this run or a previous one)
+                with lock:
+                    if digest in seen_digests or digest in in_flight:
+                        continue
+                    in_flight.add(digest)
+            hits = _scan_logged(snap, email)
+            if digest:
+                with lock:
+                    in_flight.discard(digest)
+                    # only content scanned without a hit is skipped next time: a
+                    # failed fetch is retried, and a hit is re-confirmed (from cache)
+                    if hits is not None and not hits:
+                        seen_digests.add(digest)
+            if hits:
+                writer.record(snap, orig, hits)
+
+    with ThreadPoolExecutor(max_workers=SNAPSHOT_WORKERS) as snap_ex:
+        snap_futures = [snap_ex.submit(snap_worker) for _ in range(SNAPSHOT_WORKERS)]
+        cdx_ex = ThreadPoolExecutor(max_workers=CDX_WORKERS)
+        try:
+            futures = {cdx_ex.submit(expand, u): u for u in candidates}
+            for f in as_completed(futures):
+                try:
+                    f.result()
+                except Exception as e:
+                    logger.warning("Error processing %s: %s", futures[f], e)
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            # on interrupt, drop candidates that haven't started rather than waiting on them
+            cdx_ex.shutdown(cancel_futures=True)
+            # CDX stage is done (or interrupted): one sentinel per snapshot worker,
+            # otherwise they block in snap_q.get() forever
+            for _ in snap_futures:
+                snap_q.put(None)
+        for f in snap_futures:
+            f.result()
+
+def _read_digest_file(path):
+    """Return the {email: [digests]} mapping stored at path ({} if missing or unreadable)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable digest file %s: %s", path, e)
+        return {}
+    if not isinstance(data, dict):
+        logger.warning("Ignoring digest file %s: expected an {email: [digests]} object", path)
+        return {}
+    return data
+
+def load_seen_digests(path, email):
+    # digests are per address: content scanned for one email may still mention another
+    return set(_read_digest_file(path).get(email.lower(), []))
+
+def save_seen_digests(path, email, seen_digests):
+    data = _read_digest_file(path)
+    data[email.lower()] = sorted(seen_digests)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+def setup_logging(verbose=False):
+    """Send our records to stderr in batches so workers don't block on every write."""
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    handler = logging.handlers.MemoryHandler(LOG_BUFFER, flushLevel=logging.WARNING, target=stream)
+    logging.basicConfig(level=logging.WARNING, handlers=[handler])
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
 
 def main():
     p = argparse.ArgumentParser()
@@ -134,7 +517,14 @@ def main():
     p.add_argument("--candidates", default="candidates.txt")
     p.add_argument("--out", default="found_archives.txt")
     p.add_argument("--excerpt-out", default="found_excerpts.txt")
+    p.add_argument("--seen-digests", default="seen_digests.json",
+                   help="JSON file of already-scanned CDX digests per email, reused across runs")
+    p.add_argument("--verbose", action="store_true", help="log every snapshot checked")
+    p.add_argument("--all-snapshots", action="store_true",
+                   help="keep scanning an original URL's snapshots after the first match")
     args = p.parse_args()
+    setup_logging(args.verbose)
+    early_exit = not args.all_snapshots
     email = args.email.strip()
 
     # default fallback patterns to scan if candidates don't include them
@@ -149,52 +539,45 @@ def main():
 
     try:
         with open(args.candidates, "r", encoding="utf-8") as f:
-            candidates = [line.strip() for line in f if line.strip()]
+            raw = [line.strip() for line in f if line.strip()]
     except FileNotFoundError:
-        candidates = []
+        raw = []
+    # same page listed twice (seed + search hit, trailing slash, host case, ...)
+    candidates = list(dict.fromkeys(canon(u) for u in raw))
 
     # if no candidates found from generation, seed the fallback patterns
     if not candidates:
-        print("[*] No candidates provided; using fallback patterns.")
+        logger.info("No candidates provided; using fallback patterns.")
         candidates = list(fallback_patterns)
 
-    found = set()
-    excerpts = []
+    seen_digests = load_seen_digests(args.seen_digests, email)
+    try:
+        with open(args.out, "r", encoding="utf-8") as f:
+            known = {line.strip() for line in f if line.strip()}
+    except FileNotFoundError:
+        known = set()
 
-    # process candidates
-    for u in candidates:
+    # hits are appended and flushed as they are found, so an interrupted run keeps its progress
+    with open(args.out, "a", encoding="utf-8") as out_f, \
+            open(args.excerpt_out, "a", encoding="utf-8") as exc_f:
+        writer = HitWriter(out_f, exc_f, known)
         try:
-            process_archive_url(u, email, found, excerpts)
-        except Exception as e:
-            print(f"[!] Error processing {u}: {e}", file=sys.stderr)
-
-    # if still empty, as a last effort, run CDX for a few patterns
-    if not found:
-        print("[*] No results yet — running focused CDX patterns as last effort.")
-        for pat in fallback_patterns:
-            try:
-                process_archive_url(pat, email, found, excerpts)
-            except Exception as e:
-                print(f"[!] Error processing fallback pattern {pat}: {e}", file=sys.stderr)
-
-    # write outputs
-    if found:
-        with open(args.out, "w", encoding="utf-8") as f:
-            for s in sorted(found):
-                f.write(s + "\n")
-        print(f"[+] Wrote {len(found)} snapshots to {args.out}")
-    else:
-        print("[*] No snapshots matched; nothing written to", args.out)
-
-    if excerpts:
-        with open(args.excerpt_out, "w", encoding="utf-8") as f:
-            for snap, full, snip in excerpts:
-                f.write(f"--- {snap} ---\n")
-                f.write(f"match: {full}\n")
-                f.write(f"{snip}\n\n")
-        print(f"[+] Wrote {len(excerpts)} excerpts to {args.excerpt_out}")
+            # process candidates
+            run_pipeline(candidates, email, writer, seen_digests, early_exit)
+
+            # if still empty, as a last effort, run CDX for a few patterns
+            if not writer.confirmed:
+                logger.info("No results yet — running focused CDX patterns as last effort.")
+                run_pipeline(fallback_patterns, email, writer, seen_digests, early_exit)
+        finally:
+            save_seen_digests(args.seen_digests, email, seen_digests)
+
+    if writer.confirmed:
+        logger.info("Confirmed %d snapshots, %d new written to %s",
+                    len(writer.confirmed), len(writer.found) - len(known), args.out)
+        logger.info("Wrote %d excerpts to %s", writer.n_excerpts, args.excerpt_out)
     else:
-        print("[*] No excerpts found.")
+        logger.info("No snapshots matched; nothing written to %s", args.out)
 
 if __name__ == "__main__":
     main()
@@ -15,11 +15,13 @@ import argparse
 import re
 import sys
 from urllib.parse import quote_plus
+import lxml.html
 import requests
-from bs4 import BeautifulSoup
 
 USER_AGENT = "Mozilla/5.0 (compatible; ArchiveSearch/1.0; +https://example.com)"
 SEARCH_ENGINES = ["bing", "duckduckgo"]
+# ddg wraps result links as /l/?uddg=<quoted target>
+UDDG_RE = re.compile(r"uddg=(https?%3A%2F%2F[^&]+)")
 
 # seed patterns / examples
 SEEDS = [
@@ -51,14 +53,10 @@ def bing_search(query, max_results=50):
     headers = {"User-Agent": USER_AGENT}
     r = requests.get(url, params=params, headers=headers, timeout=30)
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, "lxml")
-    links = []
+    doc = lxml.html.fromstring(r.content)
     # Bing: results in li.b_algo h2 a
-    for a in soup.select("li.b_algo h2 a[href]"):
-        href = a.get("href")
-        if href:
-            links.append(href)
-    return links
+    hrefs = doc.xpath("//li[contains(concat(' ', normalize-space(@class), ' '), ' b_algo ')]//h2//a/@href")
+    return [href for href in hrefs if href]
 
 def ddg_search(query, max_results=50):
     url = "https://html.duckduckgo.com/html/"
@@ -66,14 +64,13 @@ def ddg_search(query, max_results=50):
     data = {"q": query}
     r = requests.post(url, data=data, headers=headers, timeout=30)
     r.raise_for_status()
-    soup = BeautifulSoup(r.text, "lxml")
+    doc = lxml.html.fromstring(r.content)
     links = []
-    for a in soup.select("a[href]"):
-        href = a.get("href")
+    for href in doc.xpath("//a/@href"):
         if not href:
             continue
         # ddg returns redirect-like 'uddg=' sometimes
-        m = re.search(r"uddg=(https?%3A%2F%2F[^&]+)", href)
+        m = UDDG_RE.search(href)
         if m:
             links.append(requests.utils.unquote(m.group(1)))
         elif href.startswith("http"):